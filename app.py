@@ -1,12 +1,22 @@
-import io
 import os
 from datetime import datetime
 
 import streamlit as st
-from openai import OpenAI
-from langdetect import detect
-import pdfplumber
-from docx import Document
+
+from resume_core import (
+    FAST_MODEL_NAME,
+    MAX_JD_CHARS,
+    MAX_RESUME_CHARS,
+    MODEL_NAME,
+    GenerationError,
+    build_prompt,
+    create_docx,
+    detect_language,
+    generate_documents,
+    parse_resume_bytes,
+    start_background_parse,
+    warm_up_openai_connection,
+)
 
 # =========================================================
 # 1. 基础配置 & 安全地加载 analytics（可选）
@@ -32,11 +42,13 @@ st.markdown(HIDE_STREAMLIT_STYLE, unsafe_allow_html=True)
 
 # ---- OpenAI 客户端 ----
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
 
 if not OPENAI_API_KEY:
     st.error("未配置 OPENAI_API_KEY，请在 Streamlit → Settings → Secrets 中添加。")
-client = OpenAI()
+elif not st.session_state.get("openai_warmed"):
+    # 每个会话打开页面时预热一次连接，用户上传简历、粘贴 JD 的这段时间里握手已经完成
+    warm_up_openai_connection()
+    st.session_state["openai_warmed"] = True
 
 
 # ---- 安全加载 analytics（Google Sheet） ----
@@ -61,176 +73,46 @@ def safe_log_event(event_type: str, data: dict):
 
 
 # =========================================================
-# 2. 工具函数：读取简历 & 生成 DOCX
+# 2. 读取上传文件（解析逻辑见 resume_core.py）
 # =========================================================
 
-def read_docx(file_bytes: bytes) -> str:
-    buffer = io.BytesIO(file_bytes)
-    doc = Document(buffer)
-    texts = []
-    for para in doc.paragraphs:
-        if para.text.strip():
-            texts.append(para.text.strip())
-    return "\n".join(texts)
-
-
-def read_pdf(file_bytes: bytes) -> str:
-    buffer = io.BytesIO(file_bytes)
-    texts = []
-    with pdfplumber.open(buffer) as pdf:
-        for page in pdf.pages:
-            try:
-                t = page.extract_text() or ""
-            except Exception:
-                t = ""
-            if t.strip():
-                texts.append(t.strip())
-    return "\n\n".join(texts)
+def resume_file_type(filename: str) -> str:
+    suffix = (filename or "").lower()
+    if suffix.endswith(".docx"):
+        return "docx"
+    if suffix.endswith(".pdf"):
+        return "pdf"
+    return ""
 
 
 def extract_resume_text(uploaded_file, enable_ocr: bool) -> str:
     """根据文件类型提取文本；OCR 目前只给提示，不做真正识别"""
-    suffix = (uploaded_file.name or "").lower()
-
-    file_bytes = uploaded_file.read()
-    # 读完要复位，不然后面再读会是空
-    uploaded_file.seek(0)
-
-    if suffix.endswith(".docx"):
-        return read_docx(file_bytes)
-    elif suffix.endswith(".pdf"):
-        text = read_pdf(file_bytes)
-        if not text.strip() and enable_ocr:
-            st.warning("检测到 PDF 可能是扫描件，目前版本尚未接入 OCR 引擎，先按空文本处理。")
-        return text
-    else:
+    file_type = resume_file_type(uploaded_file.name)
+    if not file_type:
         st.error("目前仅支持 PDF 或 DOCX 文件。")
         return ""
 
-
-def create_docx(content: str) -> bytes:
-    """将纯文本写入 DOCX，并以 bytes 形式返回用于下载"""
-    doc = Document()
-    for line in content.splitlines():
-        doc.add_paragraph(line)
-    buffer = io.BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer.getvalue()
-
-
-# =========================================================
-# 3. Prompt 构建 & 调 OpenAI
-# =========================================================
-
-def detect_language(text: str) -> str:
-    try:
-        lang = detect(text[:1000])
-    except Exception:
-        lang = "en"
-    if lang.startswith("zh"):
-        return "zh"
-    return "en"
-
-
-def build_prompt(
-    resume_text: str,
-    jd_text: str,
-    focus_tags: list,
-    extra_points: str,
-    need_cover_letter: bool,
-    lang: str,
-) -> str:
-    lang_label = "中文" if lang == "zh" else "英文"
-
-    focus_str = "、".join(focus_tags) if focus_tags else "通用求职能力"
-    extra_str = extra_points.strip() or "按照目标岗位和简历内容进行专业优化。"
-
-    cover_tip = (
-        "同时生成一封匹配该岗位的求职信（Cover Letter）。"
-        if need_cover_letter
-        else "不需要生成求职信，只优化简历本身。"
-    )
-
-    jd_part = jd_text.strip() or "未提供详细 JD，只根据简历内容做通用优化。"
-
-    prompt = f"""
-你是一名专业的人才招聘与职业发展顾问，擅长为{lang_label}简历做深度优化。
-请根据【候选人原始简历】和【目标岗位/优化指令】，输出：
-
-1. 一份结构清晰、可直接投递的{lang_label}简历文本；
-2. {cover_tip}
-3. 保持内容真实性，不虚构经历或技能；
-4. 保留尽可能多的关键细节，但允许优化表述方式；
-5. 尽量量化成绩（例如用百分比、金额、规模等）；
-6. 严格避免任何水印、阅读说明或“由 AI 生成”的字样，只输出真实可用内容；
-7. 输出语言必须与【候选人原始简历】一致（本次应为：{lang_label}）。
-
-本次精修重点包括（但不限于）：{focus_str}。
-你还需要特别注意：{extra_str}
-
-请按照下面的输出格式组织结果（注意分隔标记）：
-
-==== 优化后简历 START ====
-（这里是可以直接复制到 Word 里的完整{lang_label}简历）
-==== 优化后简历 END ====
-
-==== 求职信 START ====
-（如果需要求职信，则输出完整{lang_label}求职信；如果用户不需要求职信，请留空）
-==== 求职信 END ====
-
------------------------
-【候选人原始简历】
-{resume_text}
-
------------------------
-【目标岗位 / 优化指令】
-{jd_part}
-"""
-    return prompt
-
-
-def call_openai(prompt: str) -> str:
-    response = client.responses.create(
-        model=MODEL_NAME,
-        input=prompt,
-    )
-    # 新版 Responses API：取第一段文本
+    # 上传时已经在后台开始解析，这里直接取结果（还没解析完就等它）
+    job = st.session_state.get("parse_job")
     try:
-        return response.output[0].content[0].text
+        if job and job[0] == uploaded_file.file_id:
+            text = job[1].result()
+        else:
+            # getvalue() 不移动读写位置，也不会再拷贝一份 bytes
+            text = parse_resume_bytes(uploaded_file.getvalue(), file_type)
     except Exception:
-        # 兜底：直接转成字符串
-        return str(response)
-
-
-def parse_model_output(raw: str):
-    """根据约定的分隔符切分出简历 & 求职信"""
-    resume = ""
-    cover = ""
-
-    if "==== 优化后简历 START ====" in raw:
-        try:
-            part = raw.split("==== 优化后简历 START ====")[1]
-            part = part.split("==== 优化后简历 END ====")[0]
-            resume = part.strip()
-        except Exception:
-            resume = raw.strip()
-    else:
-        resume = raw.strip()
-
-    if "==== 求职信 START ====" in raw:
-        try:
-            part = raw.split("==== 求职信 START ====")[1]
-            part = part.split("==== 求职信 END ====")[0]
-            cover = part.strip()
-        except Exception:
-            cover = ""
+        # 文件损坏或格式不标准。失败的 Future 不留在 session_state 里，否则同一个文件每次点击都报同样的错
+        st.session_state.pop("parse_job", None)
+        st.error("简历文件解析失败，文件可能已损坏或格式不标准，请另存为新的 PDF / DOCX 后重新上传。")
+        st.stop()
 
-    return resume, cover
+    if file_type == "pdf" and not text.strip() and enable_ocr:
+        st.warning("检测到 PDF 可能是扫描件，目前版本尚未接入 OCR 引擎，先按空文本处理。")
+    return text
 
 
 # =========================================================
-# 4. 页面 UI
+# 3. 页面 UI
 # =========================================================
 
 # ---- 左侧设置栏 ----
@@ -260,6 +142,7 @@ with st.sidebar:
     )
 
     need_cover_letter = st.checkbox("✉️ 生成求职信（Cover Letter）", value=True)
+    fast_mode = st.checkbox("⚡ 快速模式（更快出结果，文字质量略低）", value=False)
     enable_ocr = st.checkbox("🔍 启用 OCR（扫描 PDF）", value=False)
 
     st.markdown("---")
@@ -290,6 +173,26 @@ with col_right:
         label_visibility="collapsed",
     )
 
+# ---- 一上传就在后台解析，点击“一键生成”时通常已经解析好了 ----
+if (
+    uploaded_file is not None
+    and resume_file_type(uploaded_file.name)
+    and uploaded_file.size <= 50 * 1024 * 1024
+):
+    job = st.session_state.get("parse_job")
+    if job is None or job[0] != uploaded_file.file_id:
+        st.session_state["parse_job"] = (
+            uploaded_file.file_id,
+            start_background_parse(
+                uploaded_file.getvalue(), resume_file_type(uploaded_file.name)
+            ),
+        )
+
+# 换了简历（或移除了上传）后，旧的生成结果不再对应当前输入，直接清掉
+current_file_id = uploaded_file.file_id if uploaded_file is not None else None
+if st.session_state.get("result_file_id") != current_file_id:
+    st.session_state.pop("result", None)
+
 st.info("💡 提示：可在左侧设置“精修侧重/增强点”；若 PDF 为扫描件，可开启 OCR。")
 
 # ---- 首次打开页面的埋点 ----
@@ -302,7 +205,7 @@ safe_log_event(
 )
 
 # =========================================================
-# 5. 主按钮：一键生成
+# 4. 主按钮：一键生成
 # =========================================================
 
 generate_btn = st.button("🚀 一键生成", use_container_width=True)
@@ -316,7 +219,7 @@ if generate_btn:
         st.error("文件超过 50MB，请压缩后重新上传。")
         st.stop()
 
-    with st.spinner("正在读取简历并调用 AI 优化，请稍候…"):
+    with st.spinner("正在读取简历，请稍候…"):
         resume_text = extract_resume_text(uploaded_file, enable_ocr)
 
         if not resume_text.strip():
@@ -325,41 +228,66 @@ if generate_btn:
 
         lang = detect_language(resume_text)
 
-        prompt = build_prompt(
-            resume_text=resume_text,
-            jd_text=jd_text,
-            focus_tags=focus_tags,
-            extra_points=extra_points,
-            need_cover_letter=need_cover_letter,
-            lang=lang,
+    # build_prompt 会截断超长输入，这里提前告诉用户哪部分内容没有交给模型
+    if len(resume_text) > MAX_RESUME_CHARS:
+        st.warning(
+            f"简历文本超过 {MAX_RESUME_CHARS} 字符，中间部分（通常是较早的工作经历）"
+            "不会交给模型处理，建议精简后再上传。"
         )
-
-        raw_output = call_openai(prompt)
-        optimized_resume, cover_letter_text = parse_model_output(raw_output)
-
-    # ===== 下载区 =====
-    st.success("生成完成，你可以下载优化后的简历（以及可选的求职信）。")
-
-    resume_docx_bytes = create_docx(optimized_resume)
-    resume_filename = "Optimized_Resume.docx"
-    st.download_button(
-        "⬇️ 下载优化简历（DOCX）",
-        data=resume_docx_bytes,
-        file_name=resume_filename,
-        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    if len(jd_text.strip()) > MAX_JD_CHARS:
+        st.warning(f"JD 超过 {MAX_JD_CHARS} 字符，超出部分（结尾）不会交给模型处理。")
+
+    prompt_kwargs = dict(
+        resume_text=resume_text,
+        jd_text=jd_text,
+        focus_tags=focus_tags,
+        extra_points=extra_points,
+        lang=lang,
     )
+    prompts = {"resume": build_prompt(task="resume", **prompt_kwargs)}
+    if need_cover_letter:
+        prompts["cover_letter"] = build_prompt(task="cover_letter", **prompt_kwargs)
+
+    # 流式输出：边生成边显示，不用盯着 spinner 等到整段生成完
+    stream_area = st.empty()
+    stream_cols = stream_area.container().columns(len(prompts), gap="large")
+    placeholders = {}
+    for col, key in zip(stream_cols, prompts):
+        col.markdown("#### 优化后简历" if key == "resume" else "#### 求职信")
+        placeholders[key] = col.empty()
+        placeholders[key].caption("正在生成…")
+
+    model = FAST_MODEL_NAME if fast_mode else MODEL_NAME
+    try:
+        outputs, incomplete = generate_documents(prompts, placeholders, model=model)
+    except GenerationError as e:
+        stream_area.empty()
+        st.error(f"生成失败：{e}。请稍后重试。")
+        st.stop()
+    # 生成完毕后清掉流式区域，由下面的结果区统一展示（rerun 后也还在）
+    stream_area.empty()
+    optimized_resume = outputs["resume"]
+    cover_letter_text = outputs.get("cover_letter", "")
+
+    if not optimized_resume:
+        st.session_state.pop("result", None)
+        st.error("模型没有返回简历内容，请稍后重新生成。")
+        st.stop()
 
-    if need_cover_letter and cover_letter_text.strip():
-        cover_docx_bytes = create_docx(cover_letter_text)
-        cover_filename = "Cover_Letter.docx"
-        st.download_button(
-            "⬇️ 下载求职信（DOCX）",
-            data=cover_docx_bytes,
-            file_name=cover_filename,
-            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        )
-    elif need_cover_letter:
-        st.warning("本次模型输出中未识别到有效求职信内容，请检查提示词或重新生成。")
+    # DOCX 在生成后立刻做好、和文本一起存进 session_state：之后每次 rerun 下载按钮直接取 bytes，
+    # 不用再对全文做缓存哈希，也不怕 create_docx 的缓存被其他会话挤掉后重新生成
+    st.session_state["result"] = {
+        "resume": optimized_resume,
+        "cover_letter": cover_letter_text,
+        "need_cover_letter": need_cover_letter,
+        "jd_text": jd_text,
+        "incomplete": incomplete,
+        "resume_docx": create_docx(optimized_resume),
+        "cover_letter_docx": (
+            create_docx(cover_letter_text) if cover_letter_text.strip() else None
+        ),
+    }
+    st.session_state["result_file_id"] = uploaded_file.file_id
 
     # 记录生成事件
     safe_log_event(
@@ -371,11 +299,48 @@ if generate_btn:
             "lang": lang,
             "has_jd": bool(jd_text.strip()),
             "need_cover_letter": need_cover_letter,
+            "model": model,
         },
     )
 
+# ===== 结果 & 下载区 =====
+# 点击下载按钮会触发 rerun，结果从 session_state 取，不会丢失也不会重复生成
+result = st.session_state.get("result")
+if result:
+    st.success("生成完成，你可以下载优化后的简历（以及可选的求职信）。")
+    if result["jd_text"] != jd_text:
+        st.info("JD / 优化指令已修改，下面的结果对应修改前的内容，如需更新请重新点击“一键生成”。")
+    # 输出达到长度上限被截断时明确提示，避免用户把不完整的内容当成完整结果投递
+    for key in ("resume", "cover_letter"):
+        if key in result["incomplete"]:
+            label = "优化后简历" if key == "resume" else "求职信"
+            st.warning(f"{label}输出达到长度上限被截断，结尾可能不完整，建议精简 JD 或增强点后重新生成。")
+
+    with st.expander("查看优化后简历", expanded=True):
+        st.markdown(result["resume"])
+    if result["cover_letter"].strip():
+        with st.expander("查看求职信", expanded=True):
+            st.markdown(result["cover_letter"])
+
+    st.download_button(
+        "⬇️ 下载优化简历（DOCX）",
+        data=result["resume_docx"],
+        file_name="Optimized_Resume.docx",
+        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    )
+
+    if result["need_cover_letter"] and result["cover_letter_docx"]:
+        st.download_button(
+            "⬇️ 下载求职信（DOCX）",
+            data=result["cover_letter_docx"],
+            file_name="Cover_Letter.docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        )
+    elif result["need_cover_letter"]:
+        st.warning("本次模型输出中未识别到有效求职信内容，请检查提示词或重新生成。")
+
 # =========================================================
-# 6. 用户反馈入口
+# 5. 用户反馈入口
 # =========================================================
 
 st.markdown("---")
@@ -0,0 +1,26 @@
+# pdf_worker.py
+# pdfplumber 多进程解析用的子进程函数。
+# 子进程（forkserver）反序列化任务时会 import 这里的函数所在模块，所以这个模块只依赖 io 和 pdfplumber，
+# 不能放进 resume_core.py：那样每个子进程都要连带 import streamlit / openai / docx 等一整套依赖。
+import io
+
+import pdfplumber
+
+# 每个子进程只收一次 PDF bytes、只打开一次 PDF，之后按页号取文本；
+# 不用把整份文件随每一页任务重复 pickle 过去
+_worker_pdf = None
+
+
+def init_worker(file_bytes: bytes):
+    global _worker_pdf
+    _worker_pdf = pdfplumber.open(io.BytesIO(file_bytes))
+
+
+def page_text(idx: int) -> str:
+    page = _worker_pdf.pages[idx]
+    try:
+        return page.extract_text() or ""
+    except Exception:
+        return ""
+    finally:
+        page.close()
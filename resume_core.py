@@ -0,0 +1,599 @@
+# resume_core.py
+# 简历解析、语言识别、Prompt 构建、调用 OpenAI、导出 DOCX 等与页面无关的逻辑。
+# Streamlit 每次交互都会从头重新执行 app.py，但被 import 的模块在进程内只加载一次，
+# 所以重的 import、正则编译和函数定义都放在这里。
+import hashlib
+import io
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+from xml.sax.saxutils import escape as xml_escape
+
+import httpx
+import streamlit as st
+from openai import APIError, DefaultHttpxClient, OpenAI
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from lxml import etree
+
+try:
+    import pypdfium2 as pdfium
+
+    PDFIUM_AVAILABLE = True
+except Exception:
+    pdfium = None
+    PDFIUM_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+
+    HTTP2_AVAILABLE = True
+except Exception:
+    HTTP2_AVAILABLE = False
+
+MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o-mini")
+# 侧栏勾选“快速模式”时用的更小模型：首字和整体解码都更快，文字质量略低
+FAST_MODEL_NAME = os.getenv("FAST_MODEL_NAME", "gpt-4.1-nano")
+
+
+# =========================================================
+# 1. 读取简历 & 生成 DOCX
+# =========================================================
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+# 不解析外部实体，和 python-docx 自己的解析器设置一致
+_docx_xml_parser = etree.XMLParser(resolve_entities=False)
+RELS_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+# 正文部件的关系类型（Transitional / Strict 两种写法）
+OFFICE_DOCUMENT_RELTYPES = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument",
+    "http://purl.oclc.org/ooxml/officeDocument/relationships/officeDocument",
+)
+
+
+def _docx_main_part(zf: zipfile.ZipFile) -> str:
+    """和 python-docx 一样通过 _rels/.rels 的 officeDocument 关系找正文部件，
+    有的软件会写成 word/document2.xml 之类的名字；找不到关系时再按默认名"""
+    try:
+        rels = etree.fromstring(zf.read("_rels/.rels"), _docx_xml_parser)
+    except KeyError:
+        return "word/document.xml"
+    for rel in rels.iter(RELS_NS + "Relationship"):
+        if rel.get("Type") in OFFICE_DOCUMENT_RELTYPES and rel.get("Target"):
+            return rel.get("Target").lstrip("/")
+    return "word/document.xml"
+
+
+def read_docx(file_bytes: bytes) -> str:
+    """直接解析正文部件（通常是 word/document.xml）取文本，不构造 python-docx 的 Document / Paragraph 对象。
+
+    按文档顺序遍历所有 <w:p>，表格单元格和文本框里的段落也会读到
+    （很多简历模板用表格排版，doc.paragraphs 只给正文段落，会漏掉这部分）。
+    """
+    with zipfile.ZipFile(io.BytesIO(file_bytes)) as zf:
+        root = etree.fromstring(zf.read(_docx_main_part(zf)), _docx_xml_parser)
+
+    # 文本框会在 mc:Choice 和 mc:Fallback 里各存一份，去掉 Fallback 避免重复
+    for fallback in list(root.iter(MC_FALLBACK)):
+        fallback.getparent().remove(fallback)
+
+    # 文本归到最近的 <w:p> 祖先下：文本框段落嵌在外层段落里时不会被算两次
+    paragraphs = {}
+    for el in root.iter(W_NS + "p", W_NS + "t", W_NS + "tab", W_NS + "br", W_NS + "cr"):
+        if el.tag == W_NS + "p":
+            paragraphs[el] = []
+            continue
+        if el.tag == W_NS + "tab" and el.getparent().tag != W_NS + "r":
+            continue  # <w:pPr><w:tabs> 里的是制表位定义，不是正文里的 tab
+        para = next(el.iterancestors(W_NS + "p"), None)
+        if para is None:
+            continue
+        if el.tag == W_NS + "t":
+            paragraphs[para].append(el.text or "")
+        else:
+            paragraphs[para].append("\t" if el.tag == W_NS + "tab" else "\n")
+
+    texts = ("".join(parts).strip() for parts in paragraphs.values())
+    return "\n".join(filter(None, texts))
+
+
+# PDFium 不是线程安全的，pypdfium2 也禁止并发调用（即使是不同的文档）。
+# 后台解析线程池和各个会话的脚本线程都可能同时解析 PDF，所有 pdfium 调用都要串行
+_pdfium_lock = threading.Lock()
+
+
+def _read_pdf_pdfium(file_bytes: bytes) -> str:
+    """pypdfium2（PDFium 原生实现）提取文本，比 pdfplumber 快一个数量级"""
+    with _pdfium_lock:
+        return _read_pdf_pdfium_locked(file_bytes)
+
+
+def _read_pdf_pdfium_locked(file_bytes: bytes) -> str:
+    pdf = pdfium.PdfDocument(file_bytes)
+    texts = []
+    try:
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                t = textpage.get_text_range() or ""
+            except Exception:
+                t = ""
+            finally:
+                textpage.close()
+                page.close()
+            if t.strip():
+                texts.append(t.strip())
+    finally:
+        pdf.close()
+    return "\n\n".join(texts)
+
+
+# pdfplumber 是纯 Python 版面分析，线程受 GIL 限制，页数多时改用多进程（子进程函数在 pdf_worker.py）。
+# 不用默认的 fork：Streamlit 服务是多线程的（这里本身也可能跑在后台解析线程里），
+# fork 出的子进程可能继承一把被别的线程持有的锁（logging、import 锁、httpx 连接池）而死锁。
+# forkserver 的服务进程是单线程的，预加载 __main__ 和 pdf_worker（连带 pdfplumber / pdfminer）后，
+# 之后每个 worker 都从这个已经 import 好的进程 fork 出来，不再各自重新 import。
+try:
+    _pdf_mp_context = multiprocessing.get_context("forkserver")
+    _pdf_mp_context.set_forkserver_preload(["__main__", "pdf_worker"])
+except ValueError:
+    # Windows 没有 forkserver（本地开发时），退回 spawn
+    _pdf_mp_context = multiprocessing.get_context("spawn")
+
+# 页数阈值：forkserver 服务进程只在第一次用到时启动一次（约等于 import 一遍 pdfplumber），
+# 之后开池的成本是每个 worker 一次 fork + 各自打开一次 PDF，大约相当于解析一页；
+# pdfplumber 每页要几百毫秒，4 页起并行才明显划算，页数再少时串行更快
+PDF_PARALLEL_MIN_PAGES = 4
+
+
+def _read_pdf_pdfplumber(file_bytes: bytes) -> str:
+    # pdfplumber 只在 pypdfium2 不可用/失败时才用到，用到时再 import（会连带加载 pdfminer.six）
+    import pdfplumber
+
+    import pdf_worker
+
+    buffer = io.BytesIO(file_bytes)
+    texts = []
+    with pdfplumber.open(buffer) as pdf:
+        n_pages = len(pdf.pages)
+
+        if n_pages >= PDF_PARALLEL_MIN_PAGES:
+            workers = min(n_pages, os.cpu_count() or 1)
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=_pdf_mp_context,
+                    initializer=pdf_worker.init_worker,
+                    initargs=(file_bytes,),
+                ) as ex:
+                    texts = list(ex.map(pdf_worker.page_text, range(n_pages)))
+            except Exception:
+                # 进程池不可用时退回下面的串行解析
+                texts = []
+
+        if not texts:
+            for page in pdf.pages:
+                try:
+                    t = page.extract_text() or ""
+                except Exception:
+                    t = ""
+                finally:
+                    # 取完文本就释放这一页的 chars / rects 等缓存，否则会一直挂在 pdf 对象上直到关闭，
+                    # 页数多时内存随页数线性上涨
+                    page.close()
+                texts.append(t)
+
+    return "\n\n".join(t.strip() for t in texts if t.strip())
+
+
+def read_pdf(file_bytes: bytes) -> str:
+    """优先用 pypdfium2；未安装或解析失败时退回 pdfplumber"""
+    if PDFIUM_AVAILABLE:
+        try:
+            return _read_pdf_pdfium(file_bytes)
+        except Exception:
+            pass
+    return _read_pdf_pdfplumber(file_bytes)
+
+
+# PDF 抽出来的文本常带 \r\n、成串的空格/全角空格和大段空行，都会原样变成输入 token
+SPACE_RUN_RE = re.compile(r"[ \t\u3000\xa0]+")
+TRAILING_SPACE_RE = re.compile(r" +\n")
+BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def normalize_whitespace(text: str) -> str:
+    """合并多余空白，只保留单个空格和最多一个空行，不改变文字内容"""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = SPACE_RUN_RE.sub(" ", text)
+    text = TRAILING_SPACE_RE.sub("\n", text)
+    return BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def parse_resume(file_bytes: bytes, file_type: str) -> str:
+    if file_type == "docx":
+        text = read_docx(file_bytes)
+    else:
+        text = read_pdf(file_bytes)
+    return normalize_whitespace(text)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def parse_resume_bytes(file_bytes: bytes, file_type: str) -> str:
+    """按文件内容缓存解析结果：同一份简历再次点击生成时不用重新解析"""
+    return parse_resume(file_bytes, file_type)
+
+
+# 上传后就在后台线程里开始解析，用户还在填 JD 时解析已经在跑了
+_parse_executor = ThreadPoolExecutor(max_workers=2)
+
+
+def start_background_parse(file_bytes: bytes, file_type: str) -> Future:
+    """返回 Future；不碰任何 st.* 接口，所以可以安全地跑在非脚本线程里"""
+    return _parse_executor.submit(parse_resume, file_bytes, file_type)
+
+
+@st.cache_resource(show_spinner=False)
+def get_docx_template() -> bytes:
+    """空白 DOCX 模板只从安装目录读取一次，之后简历和求职信都从内存里的 bytes 打开"""
+    buffer = io.BytesIO()
+    Document().save(buffer)
+    return buffer.getvalue()
+
+
+def _paragraph_xml(line: str) -> str:
+    """与 doc.add_paragraph(line) 生成的 XML 等价：空行是空段落，制表符转成 <w:tab/>"""
+    if not line:
+        return "<w:p/>"
+    text = xml_escape(line).replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">')
+    return f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def create_docx(content: str) -> bytes:
+    """将纯文本写入 DOCX，并以 bytes 形式返回用于下载（同样内容只生成一次）"""
+    doc = Document(io.BytesIO(get_docx_template()))
+
+    # 一次性拼出所有 <w:p> 再整体 parse，比逐行 add_paragraph 少了大量 python-docx 对象与逐个插入；
+    # 仍然一行一个段落，用户在 Word 里编辑时和原来一样
+    paragraphs = "".join(_paragraph_xml(line) for line in content.splitlines())
+    fragment = parse_xml(f"<w:body {nsdecls('w')}>{paragraphs}</w:body>")
+    body = doc.element.body
+    sect_pr = body.find(qn("w:sectPr"))
+    for p in list(fragment):
+        if sect_pr is not None:
+            sect_pr.addprevious(p)
+        else:
+            body.append(p)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    # getvalue() 与读写位置无关，不需要 seek(0)
+    return buffer.getvalue()
+
+
+# =========================================================
+# 2. 语言识别、Prompt 构建 & 调 OpenAI
+# =========================================================
+
+HAN_RE = re.compile(r"[\u4e00-\u9fff]")
+LATIN_RE = re.compile(r"[A-Za-z]")
+LANG_SAMPLE_CHARS = 2000
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def detect_language(text: str) -> str:
+    """只需要区分中 / 英：按汉字与英文字母的数量比判断，不再依赖 langdetect"""
+    # 纯 ASCII（绝大多数英文简历）直接判为英文，isascii() 只查字符串对象上的标记位
+    if text.isascii():
+        return "en"
+
+    sample = text[:LANG_SAMPLE_CHARS]
+    # 用 sub 删掉目标字符后比较长度来计数：全程在 C 里完成，不生成匹配列表，也没有逐字符的 Python 循环
+    han = len(sample) - len(HAN_RE.sub("", sample))
+    latin = len(sample) - len(LATIN_RE.sub("", sample))
+    # 一个汉字的信息量约等于一个英文单词，中文简历里夹杂较多英文术语也仍判为中文
+    return "zh" if han > latin * 0.1 else "en"
+
+
+# 输入长度上限（按字符粗略控制 token 数）：正常 1–3 页的简历和 JD 都远低于这个值，
+# 只挡住整本作品集、整页招聘网页之类的超长粘贴，避免输入 token 和首字延迟成倍增加
+MAX_RESUME_CHARS = 12000
+MAX_JD_CHARS = 6000
+TRUNCATED_MARK = "\n……（中间内容过长，已省略）……\n"
+TRUNCATED_TAIL_MARK = "\n……（后续内容过长，已省略）"
+
+
+def clip_text(text: str, max_chars: int, tail_ratio: float = 0.0) -> str:
+    """超长时截断：保留开头（姓名、概要、最近经历），tail_ratio > 0 时再保留一段结尾"""
+    if len(text) <= max_chars:
+        return text
+    tail = int(max_chars * tail_ratio)
+    head = max_chars - tail
+    if not tail:
+        return text[:head] + TRUNCATED_TAIL_MARK
+    return text[:head] + TRUNCATED_MARK + text[-tail:]
+
+
+def build_prompt(
+    resume_text: str,
+    jd_text: str,
+    focus_tags: list,
+    extra_points: str,
+    lang: str,
+    task: str = "resume",
+) -> str:
+    """task = "resume" 生成优化后简历，task = "cover_letter" 生成求职信"""
+    lang_label = "中文" if lang == "zh" else "英文"
+
+    focus_str = "、".join(focus_tags) if focus_tags else "通用求职能力"
+    extra_str = extra_points.strip() or "按照目标岗位和简历内容进行专业优化。"
+
+    if task == "cover_letter":
+        task_tip = f"请写一封匹配该岗位的{lang_label}求职信（Cover Letter）。"
+        output_tip = "只输出求职信正文本身，不要任何前言、解释或分隔标记。"
+    else:
+        task_tip = f"请输出一份结构清晰、可直接投递的{lang_label}简历文本。"
+        output_tip = "只输出可以直接复制到 Word 里的完整简历本身，不要任何前言、解释或分隔标记。"
+
+    # 简历保留结尾一段，教育背景、技能证书常写在最后
+    resume_text = clip_text(resume_text, MAX_RESUME_CHARS, tail_ratio=0.25)
+    jd_part = clip_text(jd_text.strip(), MAX_JD_CHARS) or "未提供详细 JD，只根据简历内容做通用优化。"
+
+    # 顺序按“越稳定越靠前”排：角色与通用要求 → 简历 → JD → 精修侧重 → 本次任务。
+    # 简历和求职信两个请求（以及同一份简历的重复生成）共享完全相同的前缀；
+    # 前缀要先被一个请求处理完，后发的请求才能命中 OpenAI 的自动 prompt cache，
+    # 所以 generate_documents 会等简历请求开始输出后再发求职信请求。
+    prompt = f"""
+你是一名专业的人才招聘与职业发展顾问，擅长为{lang_label}简历做深度优化。
+下面给出【候选人原始简历】和【目标岗位/优化指令】，请按最后的【本次任务】输出。
+
+通用要求：
+1. 保持内容真实性，不虚构经历或技能；
+2. 保留尽可能多的关键细节，但允许优化表述方式；
+3. 尽量量化成绩（例如用百分比、金额、规模等）；
+4. 严格避免任何水印、阅读说明或“由 AI 生成”的字样，只输出真实可用内容；
+5. 输出语言必须与【候选人原始简历】一致（本次应为：{lang_label}）。
+
+-----------------------
+【候选人原始简历】
+{resume_text}
+
+-----------------------
+【目标岗位 / 优化指令】
+{jd_part}
+
+-----------------------
+本次精修重点包括（但不限于）：{focus_str}。
+你还需要特别注意：{extra_str}
+
+【本次任务】
+{task_tip}
+{output_tip}
+"""
+    return prompt
+
+
+# SDK 自带重试：429 / 5xx / 连接错误按指数退避重试，并遵守服务端返回的 retry-after；
+# 默认只重试 2 次，高峰期偶发限流时多等几秒总比整次生成失败要好
+OPENAI_MAX_RETRIES = 4
+
+# httpx 默认空闲 5 秒就关掉 keep-alive 连接，页面打开时预热的连接撑不到用户填完 JD；
+# 放宽到 90 秒，其余沿用 openai SDK 的默认连接数上限
+OPENAI_HTTP_LIMITS = httpx.Limits(
+    max_connections=1000, max_keepalive_connections=100, keepalive_expiry=90
+)
+
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client() -> OpenAI:
+    """跨 rerun 复用同一个客户端，保留 httpx 连接池，避免每次点击都重新握手"""
+    # HTTP/2 下简历和求职信两路并发流式请求复用同一条连接（多路复用），不用再各自握手；
+    # 没装 h2 时退回 HTTP/1.1，行为与之前一致
+    http_client = DefaultHttpxClient(http2=HTTP2_AVAILABLE, limits=OPENAI_HTTP_LIMITS)
+    return OpenAI(http_client=http_client, max_retries=OPENAI_MAX_RETRIES)
+
+
+def warm_up_openai_connection():
+    """后台发一个很轻的请求，提前完成 DNS 解析和 TLS 握手，第一次点击“一键生成”时连接已经是热的"""
+    # 在调用方（脚本线程）里取客户端：st.cache_resource 需要 Streamlit 的运行上下文
+    client = get_openai_client()
+
+    def _ping():
+        try:
+            client.with_options(timeout=5, max_retries=0).models.list()
+        except Exception:
+            pass  # 预热失败不影响正常生成
+
+    threading.Thread(target=_ping, name="openai-warmup", daemon=True).start()
+
+
+# 输出长度上限：只用来挡住模型偶尔“写长篇”拖慢整次生成。
+# 简历要“保留尽可能多的关键细节”，上限按输入上限（MAX_RESUME_CHARS 个字符，中文约 1 token/字）留足，
+# 正常长度的简历不会碰到；真碰到时 stream_openai 会报告 incomplete，页面上提示用户
+MAX_OUTPUT_TOKENS = {
+    "resume": 8000,
+    "cover_letter": 1500,
+}
+
+
+class GenerationError(RuntimeError):
+    """模型请求失败（response.failed / error 事件），页面上给用户看 str(e)"""
+
+
+def stream_openai(
+    client: OpenAI, prompt: str, key: str, out: queue.Queue, model: str = MODEL_NAME
+) -> str:
+    """
+    在工作线程里流式读取模型输出，把增量文本 (key, delta) 放进队列，最后放 (key, None) 表示结束。
+    返回结束状态："completed" 表示正常写完；"incomplete" 表示被输出上限等原因截断。
+    请求失败（API 报错、重试用尽、连接中途断开）时统一抛 GenerationError。
+    """
+    # 流正常结束却没有 response.completed 事件时按不完整处理；
+    # 连接中途断开不会走到这里，迭代 Stream 时 httpx 会直接抛异常，由下面转成 GenerationError
+    status = "incomplete"
+    try:
+        stream = client.responses.create(
+            model=model,
+            input=prompt,
+            max_output_tokens=MAX_OUTPUT_TOKENS.get(key, 3000),
+            stream=True,
+        )
+        for event in stream:
+            if event.type == "response.output_text.delta":
+                out.put((key, event.delta))
+            elif event.type == "response.completed":
+                status = "completed"
+            elif event.type == "response.incomplete":
+                status = "incomplete"
+            elif event.type == "response.failed":
+                error = event.response.error
+                raise GenerationError(error.message if error else "模型生成失败")
+            elif event.type == "error":
+                raise GenerationError(event.message or "模型生成失败")
+    except APIError as e:
+        # 限流重试用尽、鉴权失败、模型名错误（BadRequest）、连接失败等都是 APIError 子类
+        raise GenerationError(f"OpenAI 接口报错（{type(e).__name__}）：{e}") from e
+    except httpx.HTTPError as e:
+        # 流式读取过程中连接断开 / 超时，SDK 不会包装，直接是 httpx 的异常
+        raise GenerationError(f"与 OpenAI 的连接中断（{type(e).__name__}）") from e
+    finally:
+        out.put((key, None))
+    return status
+
+
+# ---- 模型输出缓存：模型和 prompt 完全相同时直接复用上次结果，不再请求 OpenAI ----
+# prompt 已经包含简历、JD、精修侧重、增强点和语言，所以 key 覆盖了所有会影响输出的输入
+COMPLETION_CACHE_TTL = 60 * 60
+COMPLETION_CACHE_MAX_ENTRIES = 64
+_completion_cache = OrderedDict()
+_completion_cache_lock = threading.Lock()
+
+
+def _completion_key(prompt: str, model: str) -> str:
+    return hashlib.blake2b(
+        f"{model}\0{prompt}".encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def _get_cached_completion(key: str) -> Optional[str]:
+    with _completion_cache_lock:
+        item = _completion_cache.get(key)
+        if item is None:
+            return None
+        ts, text = item
+        if time.time() - ts > COMPLETION_CACHE_TTL:
+            del _completion_cache[key]
+            return None
+        _completion_cache.move_to_end(key)
+        return text
+
+
+def _put_cached_completion(key: str, text: str):
+    with _completion_cache_lock:
+        _completion_cache[key] = (time.time(), text)
+        _completion_cache.move_to_end(key)
+        while len(_completion_cache) > COMPLETION_CACHE_MAX_ENTRIES:
+            _completion_cache.popitem(last=False)
+
+
+def generate_documents(prompts: dict, placeholders: dict, model: str = MODEL_NAME):
+    """
+    prompts 形如 {"resume": ..., "cover_letter": ...}，各自一个请求并发执行
+    （求职信在简历开始输出后才发，以便复用前缀缓存），总耗时约等于较慢的那一个；
+    生成过程中把已收到的文本实时写进对应的 placeholder。
+    Streamlit 元素只能在脚本主线程里更新，所以工作线程只负责收数据。
+    命中缓存的 prompt 直接用缓存结果，不发请求。
+
+    返回 (texts, incomplete)：texts 为 {key: 文本}，incomplete 为输出被截断的 key 集合。
+    任一请求失败时抛 GenerationError。
+    """
+    results = {}
+    incomplete = set()
+    cache_keys = {key: _completion_key(prompt, model) for key, prompt in prompts.items()}
+    for key in list(prompts):
+        cached = _get_cached_completion(cache_keys[key])
+        if cached is not None:
+            results[key] = cached
+            placeholders[key].markdown(cached)
+
+    to_stream = {key: p for key, p in prompts.items() if key not in results}
+    if not to_stream:
+        return results, incomplete
+
+    # 客户端在主线程里取（st.cache_resource 需要 Streamlit 的运行上下文），再交给工作线程共用
+    client = get_openai_client()
+    out = queue.Queue()
+    parts = {key: [] for key in to_stream}
+
+    # 两个请求同时发出时谁都用不上对方的前缀缓存。简历请求收到第一段输出时前缀已经 prefill 完，
+    # 这时再发求职信请求就能命中 prompt cache；求职信比简历短，总耗时仍约等于简历那一路
+    deferred = set()
+    if "resume" in to_stream and len(to_stream) > 1:
+        deferred = set(to_stream) - {"resume"}
+
+    with ThreadPoolExecutor(max_workers=len(to_stream)) as ex:
+        futures = {}
+
+        def submit(key):
+            futures[key] = ex.submit(
+                stream_openai, client, to_stream[key], key, out, model
+            )
+
+        for key in to_stream:
+            if key not in deferred:
+                submit(key)
+        pending = len(to_stream)
+        while pending:
+            # 一次把队列里已有的增量都取完再渲染，避免每个 token 都重绘一次
+            items = [out.get()]
+            while True:
+                try:
+                    items.append(out.get_nowait())
+                except queue.Empty:
+                    break
+
+            changed = set()
+            for key, delta in items:
+                if delta is None:
+                    pending -= 1
+                else:
+                    parts[key].append(delta)
+                    changed.add(key)
+                if deferred and key == "resume":
+                    # (key, None) 在 stream_openai 的 finally 里发出，这时 future 马上就结束；
+                    # 简历请求失败时不再发求职信请求，直接把它从待完成数里去掉
+                    if delta is None and futures["resume"].exception() is not None:
+                        pending -= len(deferred)
+                    else:
+                        # 简历开始输出（或正常结束）时放行被推迟的请求
+                        for deferred_key in deferred:
+                            submit(deferred_key)
+                    deferred = set()
+            for key in changed:
+                placeholders[key].markdown("".join(parts[key]))
+
+        # 工作线程里的异常在这里重新抛出
+        for key, fut in futures.items():
+            if fut.result() != "completed":
+                incomplete.add(key)
+
+    for key, chunks in parts.items():
+        text = "".join(chunks).strip()
+        results[key] = text
+        # 只缓存以 response.completed 正常结束的结果；被截断或中断的输出不缓存，
+        # 否则用户重新点击生成时会在一小时内反复拿到同一份不完整的内容
+        if text and key not in incomplete:
+            _put_cached_completion(cache_keys[key], text)
+
+    return results, incomplete